@@ -11,15 +11,47 @@ import os
 import re
 import sys
 import shutil
+import locale
+import hashlib
 import argparse
+import functools
+import tempfile
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
+
+try:
+    import pygments
+    import pygments.formatters
+    import pygments.lexers
+    from pygments.util import ClassNotFound
+except ImportError:
+    pygments = None
+
+try:
+    # Serves lexer lookups from an on-disk cache ($PYGMENTS_CACHE_FILE)
+    import pygments_cache
+except ImportError:
+    pygments_cache = None
+
+
+def _xdg_dir(name: str, default: Path) -> Path:
+    """Return an XDG base directory, ignoring empty or relative values."""
+    value = os.environ.get(name, "")
+    return Path(value) if os.path.isabs(value) else default
 
 
 # XDG defaults
-XDG_DATA_HOME = Path(os.environ.get("XDG_DATA_HOME", Path.home() / ".local" / "share"))
-XDG_CONFIG_HOME = Path(os.environ.get("XDG_CONFIG_HOME", Path.home() / ".config"))
+XDG_DATA_HOME = _xdg_dir("XDG_DATA_HOME", Path.home() / ".local" / "share")
+XDG_CONFIG_HOME = _xdg_dir("XDG_CONFIG_HOME", Path.home() / ".config")
+XDG_CACHE_HOME = _xdg_dir("XDG_CACHE_HOME", Path.home() / ".cache")
+
+# Highlighted blocks, keyed by Pygments install, lexer, formatter and code.
+# Bump the version to invalidate entries written in an older format.
+HIGHLIGHT_CACHE_VERSION = 1
+HIGHLIGHT_CACHE_DIR = XDG_CACHE_HOME / "block-run" / "highlight" / f"v{HIGHLIGHT_CACHE_VERSION}"
 
 # Search paths (user first, then system)
 if sys.platform == "win32":
@@ -43,12 +75,66 @@ else:
 
 # Marker character for chunk display protocol (ASCII Group Separator)
 MARKER = "\x1d"
+MARKER_PATTERN = re.compile(rf"^{re.escape(MARKER)}\{{(\d+)\}}{re.escape(MARKER)}$")
+
+# Block splitting: a run of blank (whitespace-only) lines, blank lines at
+# the start of the content, and the start of a "## " header line
+BLANK_LINES_PATTERN = re.compile(r"\n\s*\n")
+LEADING_BLANK_LINES_PATTERN = re.compile(r"\A(?:[^\S\n]*(?:\n|\Z))+")
+HEADER_PATTERN = re.compile(r"^(?=## )", re.MULTILINE)
+
+# Line joining blocks when they are highlighted in a single pygmentize call
+BATCH_SEPARATOR = "# ---BLOCKRUN-SEP---"
+
+# Lexers that read BATCH_SEPARATOR as a line comment. Others can highlight
+# it as code and carry state across it, so they aren't batched.
+BATCH_LEXERS = {"bash", "perl", "python", "ruby"}
+
+# Frame terminator for the Pygments coprocess protocol (ASCII Record Separator)
+FRAME_END = b"\x1e"
+
+# Coprocess run under pygmentize's interpreter. Once ready, it sends a frame
+# naming its interpreter and Pygments version, then reads "<length>\n<code>\x1e"
+# frames on stdin and answers each with a highlighted frame on stdout.
+PYGMENTS_SERVER_SOURCE = """
+import sys
+import pygments
+from pygments import highlight
+from pygments.formatters import get_formatter_by_name
+from pygments.lexers import get_lexer_by_name
+
+lexer = get_lexer_by_name(sys.argv[1])
+formatter = get_formatter_by_name(sys.argv[2])
+stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+
+ident = ("%s pygments %s" % (sys.executable, pygments.__version__)).encode("utf-8")
+stdout.write(b"%d\\n%s\\x1e" % (len(ident), ident))
+stdout.flush()
+
+while True:
+    header = stdin.readline()
+    if not header:
+        break
+    code = stdin.read(int(header)).decode("utf-8")
+    stdin.read(1)
+    result = highlight(code, lexer, formatter).encode("utf-8")
+    stdout.write(b"%d\\n%s\\x1e" % (len(result), result))
+    stdout.flush()
+"""
+
+# Terminal color escape sequences (as emitted by pygmentize)
+ANSI_PATTERN = re.compile(r"\x1b\[[0-9;]*m")
+
+# Colors and syntax highlighting, only when writing to a terminal and
+# $NO_COLOR is unset
+USE_COLOR = sys.stdout.isatty() and not os.environ.get("NO_COLOR")
 
-# Colors
-BOLD = "\033[1m"
-CYAN = "\033[36m"
-DIM = "\033[2m"
-RESET = "\033[0m"
+BOLD = "\033[1m" if USE_COLOR else ""
+CYAN = "\033[36m" if USE_COLOR else ""
+DIM = "\033[2m" if USE_COLOR else ""
+RESET = "\033[0m" if USE_COLOR else ""
+
+SEPARATOR = f"{DIM}─────────────────────────────────────────{RESET}"
 
 # Lexer mappings for syntax highlighting
 LEXER_MAP = {
@@ -107,33 +193,44 @@ def parse_shebang(shebang: str) -> Optional[str]:
     return shebang.split()[0]
 
 
-def find_wrapper(binary: str) -> Optional[Path]:
-    """
-    Find wrapper for a given binary.
+@functools.lru_cache(maxsize=None)
+def _config_map() -> dict[str, str]:
+    """Parse all config files into a binary -> wrapper name mapping."""
+    config = {}
 
-    Search order:
-      1. Config files for exact path match
-      2. Wrapper directories for basename match
-    """
-    basename = Path(binary).name
-    wrapper_name = None
-
-    # Check config files for exact path match
     for config_file in CONFIG_FILES:
         if config_file.is_file():
+            # The first line for a binary decides it for this file, even if
+            # its wrapper name is empty. Binary paths may contain "=", so
+            # every "=" on a line could end the key.
+            file_config = {}
             try:
                 for line in config_file.read_text().splitlines():
-                    if line.startswith(f"{binary}="):
-                        wrapper_name = line.split("=", 1)[1].strip()
-                        break
+                    sep = line.find("=")
+                    while sep != -1:
+                        file_config.setdefault(line[:sep], line[sep + 1 :].strip())
+                        sep = line.find("=", sep + 1)
             except (IOError, OSError):
                 pass
-        if wrapper_name:
-            break
 
+            # Earlier files take precedence; an empty name defers to later ones
+            for key, value in file_config.items():
+                if value and key not in config:
+                    config[key] = value
+
+    return config
+
+
+def find_wrapper(binary: str) -> Optional[Path]:
+    """
+    Find wrapper for a given binary.
+
+    Search order:
+      1. Config files for exact path match
+      2. Wrapper directories for basename match
+    """
     # Default to basename if no config match
-    if not wrapper_name:
-        wrapper_name = basename
+    wrapper_name = _config_map().get(binary, Path(binary).name)
 
     # Search wrapper directories
     for wrapper_dir in WRAPPER_DIRS:
@@ -144,126 +241,495 @@ def find_wrapper(binary: str) -> Optional[Path]:
     return None
 
 
+def write_all(fd: int, data: bytes) -> None:
+    """Write data to a file descriptor, then close it."""
+    try:
+        with open(fd, "wb") as f:
+            f.write(data)
+    except BrokenPipeError:
+        # Reader exited without reading everything
+        pass
+
+
+def _spawn_capture(argv: list[str], stdin_text: str = "") -> tuple[int, str]:
+    """
+    Run a command, feeding it stdin_text and capturing its stdout.
+
+    Uses os.posix_spawn where available, which glibc implements with
+    vfork-style cloning rather than copying this process's page tables.
+    Returns the exit code and the decoded output.
+    """
+    encoding = locale.getpreferredencoding(False)
+
+    if not hasattr(os, "posix_spawn"):
+        result = subprocess.run(
+            argv,
+            input=stdin_text.encode(encoding),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        return result.returncode, result.stdout.decode(encoding, errors="replace")
+
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+
+    try:
+        pid = os.posix_spawn(
+            argv[0],
+            argv,
+            os.environ,
+            file_actions=[
+                (os.POSIX_SPAWN_DUP2, stdin_read, 0),
+                (os.POSIX_SPAWN_DUP2, stdout_write, 1),
+                (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+            ],
+        )
+    except OSError:
+        os.close(stdin_write)
+        os.close(stdout_read)
+        raise
+    finally:
+        os.close(stdin_read)
+        os.close(stdout_write)
+
+    # Feed stdin from a thread so a full stdout pipe can't deadlock us
+    threading.Thread(
+        target=write_all,
+        args=(stdin_write, stdin_text.encode(encoding)),
+        daemon=True,
+    ).start()
+
+    with open(stdout_read, "rb") as f:
+        output = f.read()
+
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status), output.decode(encoding, errors="replace")
+
+
+@functools.lru_cache(maxsize=1)
+def _find_pygmentize() -> Optional[str]:
+    """Return the path to pygmentize, looked up on $PATH once per run."""
+    return shutil.which("pygmentize")
+
+
 def get_lexer(binary: str, filename: str) -> str:
     """Map binary basename to pygmentize lexer."""
     basename = Path(binary).name
     lexer = LEXER_MAP.get(basename, "")
 
     # If no lexer found, try to guess from filename
-    if not lexer and shutil.which("pygmentize"):
+    if not lexer and pygments is not None:
+        # pygments_cache mirrors the pygments.lexers lookup API
+        finder = pygments_cache or pygments.lexers
+        try:
+            lexer = finder.get_lexer_for_filename(filename).aliases[0]
+        except (ClassNotFound, IndexError, OSError):
+            pass
+    elif not lexer and _find_pygmentize():
         try:
-            result = subprocess.run(
-                ["pygmentize", "-N", filename],
-                capture_output=True,
-                text=True,
-            )
-            if result.returncode == 0:
-                lexer = result.stdout.strip()
+            returncode, output = _spawn_capture([_find_pygmentize(), "-N", filename])
+            if returncode == 0:
+                lexer = output.strip()
         except (subprocess.SubprocessError, OSError):
             pass
 
     return lexer or "text"
 
 
+_FORMATTER = None
+
+
+def _formatter_name() -> str:
+    """Pick a terminal formatter the same way pygmentize does without -f."""
+    if os.environ.get("COLORTERM", "") in ("truecolor", "24bit"):
+        return "terminal16m"
+    if "256" in os.environ.get("TERM", ""):
+        return "terminal256"
+    return "terminal"
+
+
+def _get_formatter():
+    """Return the shared Pygments terminal formatter, creating it on first use."""
+    global _FORMATTER
+
+    if _FORMATTER is None:
+        _FORMATTER = pygments.formatters.get_formatter_by_name(_formatter_name())
+
+    return _FORMATTER
+
+
 def highlight(code: str, lexer: str) -> str:
-    """Syntax highlight code using pygmentize if available."""
-    if lexer == "text" or not shutil.which("pygmentize"):
+    """
+    Syntax highlight code.
+
+    Uses Pygments in-process when it can be imported, falling back to a
+    pygmentize subprocess otherwise.
+    """
+    if lexer == "text":
+        return code
+
+    if pygments is not None:
+        try:
+            lexer_obj = pygments.lexers.get_lexer_by_name(lexer)
+        except ClassNotFound:
+            return code
+        return pygments.highlight(code, lexer_obj, _get_formatter()).rstrip("\n")
+
+    pygmentize = _find_pygmentize()
+    if not pygmentize:
         return code
 
     try:
-        result = subprocess.run(
-            ["pygmentize", "-l", lexer],
-            input=code,
-            capture_output=True,
-            text=True,
-        )
-        if result.returncode == 0:
-            return result.stdout.rstrip("\n")
+        returncode, output = _spawn_capture([pygmentize, "-l", lexer], code)
+        if returncode == 0:
+            return output.rstrip("\n")
     except (subprocess.SubprocessError, OSError):
         pass
 
     return code
 
 
-def separator() -> str:
-    """Return separator line."""
-    return f"{DIM}─────────────────────────────────────────{RESET}"
+def _pygmentize_python() -> Optional[str]:
+    """Return the Python interpreter pygmentize runs under, if it has one."""
+    pygmentize = _find_pygmentize()
+    if not pygmentize:
+        return None
 
+    try:
+        with open(pygmentize, "rb") as f:
+            shebang = f.readline().decode(errors="replace").strip()
+    except (IOError, OSError):
+        return None
 
-def split_blocks_blank_lines(content: str) -> list[str]:
-    """Split content into blocks separated by blank lines."""
-    blocks = []
-    current_block = []
-
-    for line in content.splitlines():
-        if not line.strip():
-            # Empty line - end current block if we have one
-            if current_block:
-                blocks.append("\n".join(current_block))
-                current_block = []
+    if not shebang.startswith("#!"):
+        return None
+
+    # Wrapper scripts (e.g. version manager shims) can't host the server
+    python = parse_shebang(shebang)
+    if not python or not Path(python).name.startswith(("python", "pypy")):
+        return None
+
+    return python
+
+
+def _pygments_pythons() -> list[str]:
+    """
+    Return interpreters to run the Pygments server under, best first.
+
+    $BLOCK_RUN_PYGMENTIZE forces a specific interpreter. Otherwise PyPy is
+    tried before pygmentize's own interpreter: it starts slower but lexes
+    faster, and the server only starts once per run.
+    """
+    override = os.environ.get("BLOCK_RUN_PYGMENTIZE")
+    if override:
+        return [shutil.which(override) or override]
+
+    if not _find_pygmentize():
+        return []
+
+    pythons = []
+    pypy = shutil.which("pypy3")
+    if pypy:
+        pythons.append(pypy)
+
+    python = _pygmentize_python()
+    if python and python not in pythons:
+        pythons.append(python)
+
+    return pythons
+
+
+class PygmentizeServer:
+    """
+    Long-running Pygments process that highlights blocks over its pipes.
+
+    Each block is sent as a "<length>\\n<code>\\x1e" frame and answered
+    with a frame of the same shape, so the interpreter startup and Pygments
+    import are paid once for the whole script rather than once per block.
+    """
+
+    def __init__(self, python: str, lexer: str) -> None:
+        self.proc = subprocess.Popen(
+            [python, "-c", PYGMENTS_SERVER_SOURCE, lexer, _formatter_name()],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+        # Identifies the Pygments install actually serving, for cache keys
+        self.install_id = self._read_frame()
+        if self.install_id is None:
+            self.close()
+            raise OSError(f"Pygments server failed to start under {python}")
+
+    def _read_frame(self) -> Optional[str]:
+        """Read one frame from the server, or None if it has gone away."""
+        try:
+            header = self.proc.stdout.readline()
+            if not header:
+                return None
+            result = self.proc.stdout.read(int(header))
+            if self.proc.stdout.read(1) != FRAME_END:
+                return None
+        except (OSError, ValueError):
+            return None
+
+        return result.decode("utf-8")
+
+    def highlight(self, code: str) -> Optional[str]:
+        """Highlight one block, or return None if the server has gone away."""
+        data = code.encode("utf-8")
+
+        try:
+            self.proc.stdin.write(b"%d\n%s%s" % (len(data), data, FRAME_END))
+            self.proc.stdin.flush()
+        except OSError:
+            return None
+
+        result = self._read_frame()
+        return None if result is None else result.rstrip("\n")
+
+    def close(self) -> None:
+        """Stop the server."""
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        self.proc.wait()
+
+
+def _start_pygments_server(lexer: str) -> Optional[PygmentizeServer]:
+    """Start a PygmentizeServer under the first interpreter that can host one."""
+    # An interpreter without Pygments installed exits before its handshake
+    for python in _pygments_pythons():
+        try:
+            return PygmentizeServer(python, lexer)
+        except (subprocess.SubprocessError, OSError):
+            continue
+
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _pygments_install_id() -> str:
+    """Identify the Pygments install highlighting goes through without a server."""
+    if pygments is not None:
+        return f"pygments {pygments.__version__}"
+
+    # Changes whenever pygmentize is reinstalled or upgraded
+    pygmentize = _find_pygmentize()
+    if not pygmentize:
+        return ""
+
+    try:
+        mtime = os.stat(pygmentize).st_mtime_ns
+    except OSError:
+        mtime = 0
+
+    return f"{pygmentize} {mtime}"
+
+
+def _hl_cache_key(code: str, lexer: str, install_id: str) -> str:
+    """Return the highlight cache key for a block."""
+    # Output differs between Pygments versions, and the formatter depends
+    # on the terminal, so both are part of the key
+    data = "\0".join((install_id, lexer, _formatter_name(), code)).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def _hl_cache_path(key: str) -> Path:
+    """Return the cache file for a highlight cache key."""
+    return HIGHLIGHT_CACHE_DIR / key[:2] / key
+
+
+def _read_highlight_cache(key: str) -> Optional[str]:
+    """Return cached highlighted code, or None if it isn't cached."""
+    try:
+        return _hl_cache_path(key).read_text(encoding="utf-8")
+    except (IOError, OSError, UnicodeDecodeError):
+        return None
+
+
+def _write_highlight_cache(key: str, highlighted: str) -> None:
+    """Cache highlighted code, replacing the file atomically."""
+    path = _hl_cache_path(key)
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+    except (IOError, OSError):
+        return
+
+    try:
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(highlighted)
+        os.replace(tmp_path, path)
+    except (IOError, OSError):
+        # Don't leave a partial temp file behind in the cache
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def highlight_blocks(blocks: list[str], lexer: str) -> list[str]:
+    """
+    Syntax highlight every block.
+
+    Results are cached under HIGHLIGHT_CACHE_DIR, so re-running a script
+    only highlights the blocks that changed.
+    """
+    if lexer == "text":
+        return list(blocks)
+
+    # Without in-process Pygments, the server's interpreter decides the output
+    server = _start_pygments_server(lexer) if pygments is None else None
+
+    try:
+        install_id = server.install_id if server else _pygments_install_id()
+        keys = [_hl_cache_key(block, lexer, install_id) for block in blocks]
+        highlighted = [_read_highlight_cache(key) for key in keys]
+        misses = [idx for idx, result in enumerate(highlighted) if result is None]
+
+        if misses:
+            fresh, cacheable = _highlight_uncached([blocks[idx] for idx in misses], lexer, server)
+            for idx, result in zip(misses, fresh):
+                highlighted[idx] = result
+                # Unchanged means highlighting wasn't available; don't keep that
+                if cacheable and result != blocks[idx]:
+                    _write_highlight_cache(keys[idx], result)
+    finally:
+        if server:
+            server.close()
+
+    return highlighted
+
+
+def _highlight_uncached(
+    blocks: list[str], lexer: str, server: Optional[PygmentizeServer] = None
+) -> tuple[list[str], bool]:
+    """
+    Syntax highlight every block, bypassing the cache.
+
+    Returns the highlighted blocks and whether they may be cached.
+
+    Without in-process Pygments, blocks are sent one at a time to the
+    PygmentizeServer, if one could be started. Otherwise, if the lexer is
+    in BATCH_LEXERS, all blocks are highlighted in a single pygmentize
+    call by joining them with BATCH_SEPARATOR lines and splitting the
+    result back apart.
+    """
+    if pygments is not None:
+        return [highlight(block, lexer) for block in blocks], True
+
+    if server:
+        highlighted = []
+        for block in blocks:
+            result = server.highlight(block)
+            if result is None:
+                break
+            highlighted.append(result)
+
+        if len(highlighted) == len(blocks):
+            return highlighted, True
+
+    # Keys name the server's install, so pygmentize's output isn't cached
+    # under them if the server died
+    if len(blocks) == 1 or lexer not in BATCH_LEXERS:
+        return [highlight(block, lexer) for block in blocks], server is None
+
+    joined = f"\n{BATCH_SEPARATOR}\n".join(blocks)
+    segments = [[]]
+
+    for line in highlight(joined, lexer).split("\n"):
+        # The separator may be colored, so compare it without escapes
+        if ANSI_PATTERN.sub("", line) == BATCH_SEPARATOR:
+            segments.append([])
         else:
-            current_block.append(line)
+            segments[-1].append(line)
 
-    # Don't forget the last block
-    if current_block:
-        blocks.append("\n".join(current_block))
+    # Pygments strips a lone block's outer blank lines, so drop the ones
+    # left around each separator (they may hold nothing but escapes)
+    highlighted = []
+    for lines in segments:
+        while lines and not ANSI_PATTERN.sub("", lines[0]):
+            lines.pop(0)
+        while lines and not ANSI_PATTERN.sub("", lines[-1]):
+            lines.pop()
+        highlighted.append("\n".join(lines))
 
-    return blocks
+    # A block containing the separator itself would throw off the split
+    if len(highlighted) != len(blocks):
+        return [highlight(block, lexer) for block in blocks], server is None
+
+    # Batched output depends on the neighbouring blocks, so don't cache it
+    return highlighted, False
+
+
+def split_blocks_blank_lines(content: str) -> list[str]:
+    """Split content into blocks separated by blank lines."""
+    # Surround with newlines so blank lines at either end are matched too
+    blocks = BLANK_LINES_PATTERN.split(f"\n{content}\n")
+    blocks[0] = blocks[0][1:]
+    blocks[-1] = blocks[-1][:-1]
+
+    return [block for block in blocks if block]
 
 
 def split_blocks_hierarchical(content: str) -> list[str]:
     """Split content into blocks separated by ## headers."""
-    blocks = []
-    current_block = []
-
-    for line in content.splitlines():
-        if line.startswith("## "):
-            # Header line - start new block
-            if current_block:
-                blocks.append("\n".join(current_block))
-            current_block = [line]
-        else:
-            if current_block or line.strip():
-                current_block.append(line)
+    blocks = HEADER_PATTERN.split(content)
 
-    # Don't forget the last block
-    if current_block:
-        blocks.append("\n".join(current_block))
+    # Skip blank lines before the first block
+    blocks[0] = LEADING_BLANK_LINES_PATTERN.sub("", blocks[0])
 
-    return blocks
+    # Drop the newline ending each block's last line
+    return [block[:-1] if block.endswith("\n") else block for block in blocks if block]
 
 
 def process_output(
-    output: str,
-    blocks: list[str],
-    lexer: str,
+    output: Iterable[str],
+    highlighted_blocks: list[str],
     show_block_numbers: bool,
 ) -> None:
-    """Process wrapper output, replacing markers with highlighted code."""
-    marker_pattern = re.compile(rf"^{re.escape(MARKER)}\{{(\d+)\}}{re.escape(MARKER)}$")
+    """
+    Process wrapper output, replacing markers with highlighted code.
 
-    # Use split('\n') instead of splitlines() because splitlines() treats
-    # the \x1d marker character as a line separator
-    for line in output.split("\n"):
-        match = marker_pattern.match(line)
+    Lines are handled as they arrive, so each block is shown as soon as
+    the wrapper reaches it rather than after the whole script has run.
+    """
+    block_header = f"{CYAN}# Block {{}}{RESET}".format
+
+    for line in output:
+        line = line[:-1] if line.endswith("\n") else line
+
+        # Only lines starting with the marker can be one, so skip the
+        # regex for ordinary output
+        match = line.startswith(MARKER) and MARKER_PATTERN.match(line)
         if match:
             idx = int(match.group(1))
             block_num = idx + 1
 
             # Print header (only if enabled)
             if show_block_numbers:
-                print(f"{CYAN}# Block {block_num}{RESET}")
+                print(block_header(block_num))
 
             # Print highlighted code
-            print(highlight(blocks[idx], lexer))
+            print(highlighted_blocks[idx])
 
             # Print separator
-            print(separator())
+            print(SEPARATOR, flush=True)
         else:
             # Pass through as-is
             print(line)
 
 
+def write_frames(fd: int, blocks: list[str]) -> None:
+    """Write blocks to a file descriptor as "<length>\\n<bytes>" frames."""
+    encoded = [block.encode("utf-8") for block in blocks]
+    write_all(fd, b"".join(b"%d\n%s" % (len(data), data) for data in encoded))
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Run a script block-by-block, showing output after each block.",
@@ -304,12 +770,11 @@ Config search paths:
     except (IOError, OSError) as e:
         die(f"could not read script: {e}")
 
-    lines = content.splitlines()
-    if not lines:
+    if not content:
         die("script is empty")
 
     # Parse shebang
-    shebang = lines[0]
+    shebang, _, content_without_shebang = content.partition("\n")
     if not shebang.startswith("#!"):
         die(f"no shebang found in {args.script}")
 
@@ -322,8 +787,9 @@ Config search paths:
     if not wrapper:
         die(f"no wrapper found for: {binary} (basename: {Path(binary).name})")
 
-    # Split into blocks (skip shebang line)
-    content_without_shebang = "\n".join(lines[1:])
+    # Split into blocks (skip shebang line). A final newline ends the last
+    # line rather than starting an empty one.
+    content_without_shebang = content_without_shebang.removesuffix("\n")
 
     if args.hierarchical:
         blocks = split_blocks_hierarchical(content_without_shebang)
@@ -333,8 +799,13 @@ Config search paths:
     if not blocks:
         die("no blocks found in script")
 
-    # Get lexer for syntax highlighting
-    lexer = get_lexer(binary, args.script)
+    # Get lexer for syntax highlighting ("text" shows blocks as-is)
+    lexer = get_lexer(binary, args.script) if USE_COLOR else "text"
+
+    # Highlight in the background while the wrapper starts up
+    executor = ThreadPoolExecutor(max_workers=1)
+    highlighting = executor.submit(highlight_blocks, blocks, lexer)
+    executor.shutdown(wait=False)
 
     # Print file header
     print(f"{BOLD}{args.script}{RESET}")
@@ -342,19 +813,42 @@ Config search paths:
     print()
 
     # Execute wrapper and process output
-    wrapper_args = [str(wrapper), "--binary", binary, "--"] + blocks
+    # Blocks are sent over a pipe rather than argv, which is size-limited.
+    # Windows can't hand extra descriptors to a child, so it keeps argv.
+    if sys.platform == "win32":
+        frames_read = frames_write = None
+        wrapper_args = [str(wrapper), "--binary", binary, "--"] + blocks
+        pass_fds = ()
+    else:
+        frames_read, frames_write = os.pipe()
+        wrapper_args = [str(wrapper), "--binary", binary, "--frames-fd", str(frames_read)]
+        pass_fds = (frames_read,)
 
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             wrapper_args,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
+            bufsize=1,
+            pass_fds=pass_fds,
         )
-        output = result.stdout + result.stderr
     except (subprocess.SubprocessError, OSError) as e:
         die(f"failed to run wrapper: {e}")
+    finally:
+        if frames_read is not None:
+            os.close(frames_read)
+
+    # Write from a thread so a full pipe can't stall reading the output
+    if frames_write is not None:
+        threading.Thread(target=write_frames, args=(frames_write, blocks), daemon=True).start()
+
+    highlighted_blocks = highlighting.result()
 
-    process_output(output, blocks, lexer, args.show_block_numbers)
+    # Iterating the pipe splits on '\n' only; str.splitlines() would also
+    # treat the \x1d marker character as a line separator
+    with proc:
+        process_output(proc.stdout, highlighted_blocks, args.show_block_numbers)
 
 
 if __name__ == "__main__":
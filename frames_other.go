@@ -0,0 +1,11 @@
+//go:build !unix
+
+package main
+
+import "errors"
+
+// writeFramesFile is unsupported without Unix descriptor inheritance, so
+// blocks are passed to the wrapper in argv instead.
+func writeFramesFile(blocks []string) (int, error) {
+	return -1, errors.New("passing blocks by descriptor is not supported on this platform")
+}
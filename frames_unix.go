@@ -0,0 +1,39 @@
+//go:build unix
+
+package main
+
+import (
+	"bufio"
+	"fmt"
+	"io"
+	"os"
+	"syscall"
+)
+
+// writeFramesFile writes blocks to an unlinked temporary file as
+// "<length>\n<bytes>" frames and returns an inheritable descriptor for it,
+// positioned at the start.
+func writeFramesFile(blocks []string) (int, error) {
+	f, err := os.CreateTemp("", "block-run-blocks-")
+	if err != nil {
+		return -1, err
+	}
+	defer f.Close()
+
+	// The data lives on for as long as a descriptor to it is open
+	os.Remove(f.Name())
+
+	w := bufio.NewWriter(f)
+	for _, block := range blocks {
+		fmt.Fprintf(w, "%d\n%s", len(block), block)
+	}
+	if err := w.Flush(); err != nil {
+		return -1, err
+	}
+	if _, err := f.Seek(0, io.SeekStart); err != nil {
+		return -1, err
+	}
+
+	// Unlike f's own descriptor, the duplicate isn't closed on exec
+	return syscall.Dup(int(f.Fd()))
+}
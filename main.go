@@ -12,6 +12,7 @@ import (
 	"path/filepath"
 	"regexp"
 	"runtime"
+	"strconv"
 	"strings"
 	"syscall"
 )
@@ -285,9 +286,15 @@ func main() {
 		die("no blocks found in script")
 	}
 
-	// Build wrapper arguments
-	wrapperArgs := []string{wrapper, "--binary", binary, "--"}
-	wrapperArgs = append(wrapperArgs, blocks...)
+	// Build wrapper arguments. Blocks are passed through a file descriptor
+	// when possible, since argv is limited in size.
+	wrapperArgs := []string{wrapper, "--binary", binary}
+	if fd, err := writeFramesFile(blocks); err == nil {
+		wrapperArgs = append(wrapperArgs, "--frames-fd", strconv.Itoa(fd))
+	} else {
+		wrapperArgs = append(wrapperArgs, "--")
+		wrapperArgs = append(wrapperArgs, blocks...)
+	}
 
 	// Execute wrapper, replacing current process
 	if err := syscall.Exec(wrapper, wrapperArgs, os.Environ()); err != nil {